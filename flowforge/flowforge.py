@@ -27,14 +27,57 @@ Usage Example:
 Future extensions may add additional features and diagram types.
 """
 
-import xml.etree.ElementTree as ET
-import base64
-import zlib
 import gzip
 import re
+import sys
 import logging
 import binascii
-from urllib.parse import unquote
+import functools
+import hashlib
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from types import MappingProxyType
+from urllib.parse import unquote_to_bytes
+
+# Prefer lxml's libxml2-backed parser when it is installed; fall back to the stdlib.
+try:
+    from lxml import etree as ET
+    _HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    _HAS_LXML = False
+
+# Prefer ISA-L's vectorized inflate when it is installed; it mirrors the zlib API.
+# _zlib is the inflate backend, while zlib always names the stdlib module.
+try:
+    from isal import isal_zlib as _zlib
+except ImportError:
+    _zlib = zlib
+
+# Upper bound for the initial output buffer used when inflating a diagram.
+_INFLATE_BUFSIZE_CAP = 64 * 1024 * 1024
+
+# Style strings longer than this are unlikely to repeat and bypass the style caches.
+_STYLE_CACHE_MAX_LEN = 512
+
+# Matches the payload of each <diagram> element in an mxfile.
+_DIAGRAM_RE = re.compile(rb"<diagram[^>]*>(.*?)</diagram>", re.DOTALL)
+
+# Maps the urlsafe base64 alphabet onto the standard one.
+_URLSAFE_B64_TABLE = bytes.maketrans(b"-_", b"+/")
+
+# Matches bytes outside printable ASCII; used to salvage undecodable payloads.
+_NON_PRINTABLE_RE = re.compile(rb"[^\x20-\x7E]")
+
+# Mermaid node templates keyed by shape token; other shapes render as rectangles.
+_NODE_SHAPES = {
+    "rhombus": '{0}{{"{1}"}}',
+    "ellipse": '{0}(( "{1}" ))',
+    "stadium": '{0}("{1}")',
+}
+_DEFAULT_NODE_SHAPE = '{0}["{1}"]'
 
 
 # --- Custom Exception Classes ---
@@ -63,15 +106,135 @@ def parse_style(style_str):
     style_dict = {}
     if style_str:
         for token in style_str.split(';'):
-            if '=' in token:
-                key, value = token.split('=', 1)
+            key, sep, value = token.partition('=')
+            if sep:
                 style_dict[key] = value
-            else:
-                if token:
-                    style_dict[token] = True
+            elif token:
+                style_dict[token] = True
     return style_dict
 
 
+@functools.lru_cache(maxsize=8192)
+def _parse_style_cached(style_str):
+    return MappingProxyType(parse_style(style_str))
+
+
+def _style_mapping(style_str):
+    """
+    Returns a read-only parsed view of a style string.
+
+    Most diagrams reuse a handful of style strings across many cells, so parsed styles
+    are cached and shared. Unusually long strings are unlikely to repeat and bypass the cache.
+
+    :param style_str: The style string from a Draw.io cell.
+    :return: Read-only mapping with style keys and values.
+    """
+    if len(style_str) > _STYLE_CACHE_MAX_LEN:
+        return MappingProxyType(parse_style(style_str))
+    return _parse_style_cached(style_str)
+
+
+def _node_template(style):
+    """
+    Picks the Mermaid node template for a parsed style.
+
+    :param style: Parsed style mapping of a vertex cell.
+    :return: Format string taking the Mermaid node id and the label.
+    """
+    shape = style.get("shape", "").lower()
+    if shape != "rhombus" and "ellipse" in style:
+        shape = "ellipse"
+    elif shape not in _NODE_SHAPES and style.get("rounded") == "1":
+        shape = "stadium"
+    return _NODE_SHAPES.get(shape, _DEFAULT_NODE_SHAPE)
+
+
+def _edge_arrow(style):
+    """
+    Picks the Mermaid arrow for a parsed style.
+
+    :param style: Parsed style mapping of an edge cell.
+    :return: Mermaid arrow notation.
+    """
+    arrow = "-->"
+    if style.get("dashed") or style.get("dashed") == "1":
+        arrow = "-.->"
+    if style.get("endArrow") == "none":
+        arrow = arrow.replace("->", "-")
+    return arrow
+
+
+# Templates and arrows depend only on the style, which few distinct strings cover
+@functools.lru_cache(maxsize=8192)
+def _node_template_cached(style_str):
+    return _node_template(_parse_style_cached(style_str))
+
+
+@functools.lru_cache(maxsize=8192)
+def _edge_arrow_cached(style_str):
+    return _edge_arrow(_parse_style_cached(style_str))
+
+
+def _pick_wbits(data):
+    """
+    Picks the zlib wbits value matching the header of a compressed payload.
+
+    :param data: The compressed payload.
+    :return: 31 for gzip, 15 for a zlib header, and -15 for raw deflate otherwise.
+    """
+    if data[:2] == b'\x1f\x8b':
+        return 31
+    if data[:1] == b'\x78':
+        return 15
+    return -15
+
+
+def _inflate(data, wbits):
+    """
+    Decompresses a payload with an initial output buffer sized for typical diagram XML.
+
+    Draw.io XML usually compresses at least tenfold; starting from that estimate avoids
+    repeatedly growing the output buffer. The estimate is capped at 64 MiB.
+
+    :param data: The compressed payload.
+    :param wbits: The zlib wbits value describing the container format.
+    :return: The decompressed bytes.
+    :raises _zlib.error: If the payload cannot be decompressed.
+    """
+    return _zlib.decompress(data, wbits, min(len(data) * 10, _INFLATE_BUFSIZE_CAP))
+
+
+# --- Internal Representation ---
+class Node:
+    """A vertex cell of a diagram page."""
+    __slots__ = ("id", "mermaid_id", "label", "style", "style_dict", "geometry", "parent", "is_group")
+
+    def __init__(self, id, label, style, style_dict, geometry, parent):
+        self.id = id
+        self.mermaid_id = "N" + id
+        self.label = label
+        self.style = style
+        self.style_dict = style_dict
+        self.geometry = geometry
+        self.parent = parent
+        # Group and swimlane containers become Mermaid subgraphs. The raw style is searched
+        # so that shapes such as mxgraph.aws4.group and mxgraph.aws4.groupCenter count too.
+        self.is_group = "group" in style or "swimlane" in style
+
+
+class Edge:
+    """An edge cell of a diagram page."""
+    __slots__ = ("id", "source", "target", "label", "style", "style_dict")
+
+    def __init__(self, id, source, target, label, style, style_dict):
+        self.id = id
+        self.source = source
+        self.target = target
+        self.label = label
+        self.style = style
+        self.style_dict = style_dict
+
+
 # --- Main Converter Class ---
 class FlowForgeConverter:
     """
@@ -103,18 +266,63 @@ class FlowForgeConverter:
         self.node_map = {}
         self.diagram = {"nodes": [], "edges": [], "groups": {}}
         self.diagram_pages = []
+        self._decompress_cache_key = None
+        self._non_vertex_ids = set()
+        self._subgraph_cache = {}
+        self._subgraphs_open = set()
+        self._subgraph_cycles = 0
+        # Reusable lxml parsers, keyed by strict mode (see _get_parser)
+        self._parsers = {}
+
+    # --- XML Parser Configuration ---
+    def _parser_options(self):
+        """
+        Returns the lxml parser options for the current strict_mode.
+
+        Entity expansion is disabled because diagram files come from untrusted sources.
+        Diagrams never look elements up by xml:id and carry no meaningful whitespace-only
+        text, so neither the id table nor the blank text nodes are built. In relaxed mode
+        libxml2 recovers from malformed XML.
+
+        :return: Keyword arguments for lxml's XMLParser and iterparse.
+        """
+        return {
+            "huge_tree": True, "collect_ids": False, "remove_blank_text": True,
+            "resolve_entities": False, "recover": not self.strict_mode,
+        }
+
+    def _get_parser(self):
+        """
+        Returns a reusable lxml parser for the current strict_mode.
+
+        lxml parsers can be reused, so one is built per mode and kept; strict_mode is read
+        on every call so that changing it after construction takes effect. Expat parsers
+        are single-use, so the stdlib path creates one per parse.
+
+        :return: An lxml XMLParser, or None when lxml is not installed.
+        """
+        if not _HAS_LXML:
+            return None
+        mode = bool(self.strict_mode)
+        parser = self._parsers.get(mode)
+        if parser is None:
+            parser = self._parsers[mode] = ET.XMLParser(**self._parser_options())
+        return parser
 
     # --- File and Data Loading Methods ---
     def load_file(self, file_path):
         """
-        Loads the content of a file into a string.
+        Loads the raw content of a file.
+
+        The content is kept as bytes so it reaches the XML parser without being
+        decoded and re-encoded along the way.
 
         :param file_path: Path to the Draw.io file.
-        :return: The file content as a string.
+        :return: The file content as bytes.
         :raises Exception: If file cannot be read.
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
+            with open(file_path, 'rb') as f:
                 data = f.read()
             self.logger.info(f"File loaded successfully: {file_path}")
             return data
@@ -124,367 +332,486 @@ class FlowForgeConverter:
 
     # --- Decompression and Multi-Page Extraction ---
     def _decompress_data(self, xml_data):
+        """
+        Populates self.diagram_pages with the decompressed XML documents of the input.
+
+        The input may be given as str or as any bytes-like object (e.g. an mmap of the
+        file); pages are always stored as UTF-8 bytes. The result is memoized on a hash
+        of the input, so calling list_diagram_pages() and then convert() on the same
+        content only decompresses it once.
+        """
+        if isinstance(xml_data, str):
+            xml_data = xml_data.encode('utf-8')
+        # The hash reads any buffer in place, so a repeated mmap or memoryview is never copied
+        # Strict and relaxed mode can produce different pages, so the mode is part of the key
+        key = (bool(self.strict_mode), hashlib.blake2b(xml_data, digest_size=16).digest())
+        if key == self._decompress_cache_key and self.diagram_pages:
+            self.logger.debug("Reusing diagram pages decompressed from identical input.")
+            return
+        if not isinstance(xml_data, bytes):
+            xml_data = bytes(xml_data)
+        self.diagram_pages = []
+        self._decompress_cache_key = None
+        self._decompress_pages(xml_data)
+        self._decompress_cache_key = key
+
+    def _decompress_pages(self, xml_data):
         """
         Checks if the XML data is compressed. If the <mxGraphModel> tag is not found,
         it assumes the content inside <diagram> is compressed (base64 + deflate).
         In relaxed mode, tries multiple known wbits parameters to handle variations
         in compression headers (raw deflate, zlib, gzip) and then a gzip fallback.
 
-        Populates self.diagram_pages with decompressed XML strings.
+        Appends the decompressed XML documents to self.diagram_pages.
         """
-        if "<mxGraphModel" in xml_data:
+        if b"<mxGraphModel" in xml_data:
             self.logger.debug("Found uncompressed <mxGraphModel> tag directly in the file.")
             self.diagram_pages.append(xml_data)
             return
 
         # Handle compressed data
-        diagrams = re.findall(r"<diagram[^>]*>(.*?)</diagram>", xml_data, re.DOTALL)
-        
-        if not diagrams:
-            self.logger.debug("No <diagram> tags found. Checking if entire file is an mxfile.")
-            # Try parsing as mxfile directly - some files use mxfile as root element
-            try:
-                root = ET.fromstring(xml_data)
-                if root.tag == 'mxfile':
-                    self.logger.debug("File is an mxfile. Extracting diagrams.")
-                    for diagram in root.findall('diagram'):
-                        diagram_content = diagram.text if diagram.text else ""
-                        diagrams.append(diagram_content)
-            except ET.ParseError as e:
-                self.logger.debug(f"Failed to parse XML looking for mxfile: {str(e)}")
-        
+        diagrams = self._extract_diagrams(xml_data)
+
         if diagrams:
             self.logger.debug(f"Found {len(diagrams)} <diagram> tag(s). Attempting decompression.")
-            for d_index, d in enumerate(diagrams):
-                d = d.strip()
-                is_decompressed = False
-                
-                if not d:  # Skip empty diagram data
-                    self.logger.warning(f"Diagram {d_index} is empty. Skipping.")
-                    continue
-                
-                # Try direct XML parse if it looks like uncompressed XML
-                if d.startswith('<') and '<mxGraphModel' in d:
-                    self.logger.debug(f"Diagram {d_index} appears to be uncompressed XML. Adding directly.")
-                    self.diagram_pages.append(d)
-                    continue
-                
-                # Try URL decoding first (some draw.io files use URL encoding)
-                try:
-                    d_decoded = unquote(d)
-                    if '<mxGraphModel' in d_decoded:
-                        self.logger.debug(f"Diagram {d_index} was URL encoded. Adding decoded version.")
-                        self.diagram_pages.append(d_decoded)
-                        continue
-                except Exception as e:
-                    self.logger.debug(f"URL decoding attempt failed: {str(e)}")
-                
-                # Try base64 decoding
-                try:
-                    # Handle padding issues - draw.io might not include proper padding
-                    padding_needed = len(d) % 4
-                    if padding_needed:
-                        d += '=' * (4 - padding_needed)
-                    
-                    # Try to decode as base64
-                    try:
-                        decoded = base64.b64decode(d)
-                    except binascii.Error:
-                        # Sometimes drawio uses urlsafe base64
-                        try:
-                            decoded = base64.urlsafe_b64decode(d)
-                        except binascii.Error as e:
-                            self.logger.debug(f"Both standard and urlsafe base64 decoding failed: {str(e)}")
-                            raise
-                except Exception as e:
-                    self.logger.error(f"Base64 decoding failed for diagram {d_index}: {str(e)}")
-                    if self.strict_mode:
-                        raise DiagramDecompressionError(str(e))
-                    else:
-                        continue
-
-                # Check if it's already XML (uncompressed but base64 encoded)
-                try:
-                    xml_check = decoded.decode('utf-8', errors='ignore')
-                    if xml_check.startswith('<') and '<mxGraphModel' in xml_check:
-                        self.logger.debug(f"Diagram {d_index} was base64 encoded XML. Adding decoded version.")
-                        self.diagram_pages.append(xml_check)
-                        is_decompressed = True
-                        continue
-                except UnicodeDecodeError:
-                    # Not UTF-8 text, continue with decompression attempts
-                    pass
-
-                # Try various decompression methods
-                decompression_attempts = [
-                    # (wbits, description)
-                    (-15, "raw deflate"),
-                    (47, "deflate with zlib header & 32k window"),
-                    (31, "deflate with zlib header & 16k window"),
-                    (15, "deflate with zlib header & 8k window"),
-                    (0, "auto-detect zlib/gzip header")
-                ]
-                
-                for wbits, desc in decompression_attempts:
-                    if is_decompressed:
-                        break
-                    try:
-                        if wbits == 0:
-                            # Auto-detect header
-                            decompressed = zlib.decompress(decoded, zlib.MAX_WBITS | 32)
-                        else:
-                            decompressed = zlib.decompress(decoded, wbits)
-                        
-                        xml_text = decompressed.decode('utf-8', errors='replace')
-                        if "<mxGraphModel" in xml_text:
-                            self.diagram_pages.append(xml_text)
-                            self.logger.info(f"Successfully decompressed diagram {d_index} using {desc}.")
-                            is_decompressed = True
-                        else:
-                            self.logger.warning(
-                                f"Decompression with {desc} succeeded, but no <mxGraphModel> found in diagram {d_index}."
-                            )
-                    except Exception as e:
-                        self.logger.debug(f"Decompression attempt with {desc} failed: {str(e)}")
-                
-                # Try gzip if still not decompressed and it looks like gzip
-                if not is_decompressed and len(decoded) >= 2 and decoded[:2] == b'\x1f\x8b':
-                    try:
-                        decompressed = gzip.decompress(decoded)
-                        xml_text = decompressed.decode('utf-8', errors='replace')
-                        if "<mxGraphModel" in xml_text:
-                            self.diagram_pages.append(xml_text)
-                            self.logger.info(f"Successfully decompressed diagram {d_index} using gzip.")
-                            is_decompressed = True
-                        else:
-                            self.logger.warning(f"Gzip decompression succeeded, but no <mxGraphModel> found in diagram {d_index}.")
-                    except Exception as e:
-                        self.logger.debug(f"Gzip decompression attempt failed: {str(e)}")
-                
-                # Try PAKO/PAKO 0.2.0 variant (some newer draw.io files)
-                if not is_decompressed:
-                    try:
-                        inflator = zlib.decompressobj(16 + zlib.MAX_WBITS)
-                        decompressed = inflator.decompress(decoded)
-                        xml_text = decompressed.decode('utf-8', errors='replace')
-                        if "<mxGraphModel" in xml_text:
-                            self.diagram_pages.append(xml_text)
-                            self.logger.info(f"Successfully decompressed diagram {d_index} using PAKO variant.")
-                            is_decompressed = True
-                    except Exception as e:
-                        self.logger.debug(f"PAKO variant decompression attempt failed: {str(e)}")
-                
-                # Last resort: try to interpret as plain XML even if it looks like garbage
-                if not is_decompressed and not self.strict_mode:
-                    try:
-                        # Just a sanity check - see if there's any XML-like content
-                        cleaned = re.sub(r'[^\x20-\x7E]', '', decoded.decode('latin-1', errors='ignore'))
-                        if '<' in cleaned and '>' in cleaned:
-                            self.logger.warning(f"Diagram {d_index} couldn't be properly decompressed but contains XML-like content. Attempting to process.")
-                            self.diagram_pages.append(cleaned)
-                            is_decompressed = True
-                    except Exception as e:
-                        self.logger.debug(f"Last resort XML interpretation failed: {str(e)}")
-                
-                if not is_decompressed:
-                    msg = (
-                        f"Failed to decompress diagram {d_index} with all known parameters. "
-                        "Likely corrupt or unsupported compression format."
-                    )
-                    self.logger.error(msg)
-                    if self.strict_mode:
-                        raise DiagramDecompressionError(msg)
-                    # In relaxed mode, skip this diagram page
+            # zlib and ISA-L release the GIL while inflating, so pages decompress in parallel
+            # when there is more than one page and more than one CPU to run them on
+            workers = min(len(diagrams), os.cpu_count() or 1)
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    pages = list(executor.map(self._decompress_page, range(len(diagrams)), diagrams))
+            else:
+                pages = [self._decompress_page(i, d) for i, d in enumerate(diagrams)]
+            self.diagram_pages.extend(page for page in pages if page is not None)
         else:
+            # Input containing an uncompressed model was already returned above
             self.logger.debug("No <diagram> tags or mxfile format detected.")
-            # Last attempt: check if it's a plain XML file with mxGraphModel
-            if "<mxGraphModel" in xml_data:
-                self.diagram_pages.append(xml_data)
-                self.logger.info("Found uncompressed mxGraphModel in the input.")
-            else:
-                msg = "Input data does not contain valid Draw.io XML, <diagram> tags, or an mxfile."
-                self.logger.error(msg)
-                if self.strict_mode:
-                    raise DiagramDecompressionError(msg)
+            msg = "Input data does not contain valid Draw.io XML, <diagram> tags, or an mxfile."
+            self.logger.error(msg)
+            if self.strict_mode:
+                raise DiagramDecompressionError(msg)
+
+    def _extract_diagrams(self, xml_data):
+        """
+        Returns the raw payloads of the <diagram> elements in an mxfile document.
+
+        The document is parsed rather than scanned with a regex, which is several times
+        faster on large files and also handles entity-escaped payloads. If the input is
+        not well-formed XML, the regex scan is used as a fallback.
+        """
+        try:
+            root = ET.fromstring(xml_data, self._get_parser())
+        except ET.ParseError as e:
+            self.logger.debug(f"Failed to parse XML looking for <diagram> tags: {str(e)}")
+            root = None
+        # A recovering parser returns None for input that is not XML at all
+        if root is not None:
+            diagrams = [d.text.encode('utf-8') if d.text else b"" for d in root.iter('diagram')]
+            if diagrams:
+                return diagrams
+        self.logger.debug("No <diagram> tags found by the parser. Scanning the raw input.")
+        return _DIAGRAM_RE.findall(xml_data)
+
+    def _decompress_page(self, d_index, d):
+        """
+        Decodes and decompresses the payload of a single <diagram> element.
+
+        :param d_index: Index of the diagram, used in log messages.
+        :param d: The raw payload of the <diagram> element.
+        :return: The XML document of the page, or None if it was skipped in relaxed mode.
+        :raises DiagramDecompressionError: In strict mode, if the payload cannot be decompressed.
+        """
+        d = d.strip()
+        page = None
+
+        if not d:  # Skip empty diagram data
+            self.logger.warning(f"Diagram {d_index} is empty. Skipping.")
+            return None
+
+        # Try direct XML parse if it looks like uncompressed XML
+        if d.startswith(b'<') and b'<mxGraphModel' in d:
+            self.logger.debug(f"Diagram {d_index} appears to be uncompressed XML. Adding directly.")
+            return d
+
+        # Try URL decoding first (some draw.io files use URL encoding). URL-encoded XML
+        # starts with an escaped "<", and base64 never contains "%", so only payloads
+        # with an escape near the start are copied through unquote.
+        if b'%' in d[:64]:
+            try:
+                d_decoded = unquote_to_bytes(d)
+                if b'<mxGraphModel' in d_decoded:
+                    self.logger.debug(f"Diagram {d_index} was URL encoded. Adding decoded version.")
+                    return d_decoded
+            except Exception as e:
+                self.logger.debug(f"URL decoding attempt failed: {str(e)}")
+
+        # Try base64 decoding
+        try:
+            # Handle padding issues - draw.io might not include proper padding
+            padding_needed = len(d) % 4
+            if padding_needed:
+                d += b'=' * (4 - padding_needed)
+
+            # Try to decode as base64
+            try:
+                decoded = binascii.a2b_base64(d)
+            except binascii.Error:
+                # Sometimes drawio uses urlsafe base64
+                try:
+                    decoded = binascii.a2b_base64(d.translate(_URLSAFE_B64_TABLE))
+                except binascii.Error as e:
+                    self.logger.debug(f"Both standard and urlsafe base64 decoding failed: {str(e)}")
+                    raise
+        except Exception as e:
+            self.logger.error(f"Base64 decoding failed for diagram {d_index}: {str(e)}")
+            if self.strict_mode:
+                raise DiagramDecompressionError(str(e))
+            return None
+
+        # Check if it's already XML (uncompressed but base64 encoded)
+        if decoded.startswith(b'<') and b'<mxGraphModel' in decoded:
+            self.logger.debug(f"Diagram {d_index} was base64 encoded XML. Adding decoded version.")
+            return decoded
+
+        # Draw.io almost always writes raw deflate, so decompress once using the format
+        # indicated by the header and only fall back to trying every variant on failure.
+        sniffed_wbits = _pick_wbits(decoded)
+        try:
+            decompressed = _inflate(decoded, sniffed_wbits)
+            if b"<mxGraphModel" in decompressed:
+                self.logger.info(f"Successfully decompressed diagram {d_index} using wbits={sniffed_wbits}.")
+                return decompressed
+        except _zlib.error as e:
+            self.logger.debug(f"Decompression with detected wbits={sniffed_wbits} failed: {str(e)}")
+
+        # Try various decompression methods
+        decompression_attempts = [
+            # (wbits, description)
+            (-15, "raw deflate"),
+            (47, "deflate with zlib header & 32k window"),
+            (31, "deflate with zlib header & 16k window"),
+            (15, "deflate with zlib header & 8k window"),
+            (0, "auto-detect zlib/gzip header")
+        ]
+
+        for wbits, desc in decompression_attempts:
+            if page is not None:
+                break
+            if wbits == sniffed_wbits:
+                # Already tried above; inflating again would give the same result
+                continue
+            try:
+                if wbits == 0:
+                    # Auto-detect header
+                    decompressed = _inflate(decoded, zlib.MAX_WBITS | 32)
+                else:
+                    decompressed = _inflate(decoded, wbits)
+
+                if b"<mxGraphModel" in decompressed:
+                    page = decompressed
+                    self.logger.info(f"Successfully decompressed diagram {d_index} using {desc}.")
+                else:
+                    self.logger.warning(
+                        f"Decompression with {desc} succeeded, but no <mxGraphModel> found in diagram {d_index}."
+                    )
+            except Exception as e:
+                self.logger.debug(f"Decompression attempt with {desc} failed: {str(e)}")
+
+        # Try gzip if still not decompressed and it looks like gzip
+        if page is None and len(decoded) >= 2 and decoded[:2] == b'\x1f\x8b':
+            try:
+                decompressed = gzip.decompress(decoded)
+                if b"<mxGraphModel" in decompressed:
+                    page = decompressed
+                    self.logger.info(f"Successfully decompressed diagram {d_index} using gzip.")
+                else:
+                    self.logger.warning(f"Gzip decompression succeeded, but no <mxGraphModel> found in diagram {d_index}.")
+            except Exception as e:
+                self.logger.debug(f"Gzip decompression attempt failed: {str(e)}")
+
+        # Try PAKO/PAKO 0.2.0 variant (some newer draw.io files)
+        if page is None:
+            try:
+                inflator = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                decompressed = inflator.decompress(decoded)
+                if b"<mxGraphModel" in decompressed:
+                    page = decompressed
+                    self.logger.info(f"Successfully decompressed diagram {d_index} using PAKO variant.")
+            except Exception as e:
+                self.logger.debug(f"PAKO variant decompression attempt failed: {str(e)}")
+
+        # Last resort: try to interpret as plain XML even if it looks like garbage
+        if page is None and not self.strict_mode:
+            try:
+                # Just a sanity check - see if there's any XML-like content
+                cleaned = _NON_PRINTABLE_RE.sub(b'', decoded)
+                if b'<' in cleaned and b'>' in cleaned:
+                    self.logger.warning(f"Diagram {d_index} couldn't be properly decompressed but contains XML-like content. Attempting to process.")
+                    page = cleaned
+            except Exception as e:
+                self.logger.debug(f"Last resort XML interpretation failed: {str(e)}")
+
+        if page is None:
+            msg = (
+                f"Failed to decompress diagram {d_index} with all known parameters. "
+                "Likely corrupt or unsupported compression format."
+            )
+            self.logger.error(msg)
+            if self.strict_mode:
+                raise DiagramDecompressionError(msg)
+            # In relaxed mode, skip this diagram page
+        return page
 
     def list_diagram_pages(self, xml_data):
         """
         Parses the raw file content and returns a list of diagram page indices.
 
-        :param xml_data: The raw file content.
+        :param xml_data: The raw file content, as str or a bytes-like object.
         :return: List of indices representing available diagram pages.
         """
-        self.diagram_pages = []
         self._decompress_data(xml_data)
         page_indices = list(range(len(self.diagram_pages)))
         self.logger.info(f"Diagram pages available: {page_indices}")
         return page_indices
 
     # --- XML Parsing and Internal Representation Building ---
-    def _parse_xml(self, xml_data):
+    def _iter_cells(self, xml_data):
         """
-        Parses an XML string into an ElementTree root.
+        Yields the top-level <mxCell> elements of a diagram page together with their
+        <mxGeometry> child, so callers do not have to search each cell for it.
 
-        :param xml_data: The uncompressed XML string.
-        :return: ElementTree root element.
-        :raises DiagramParsingError: If XML parsing fails.
+        The page is streamed through iterparse and every cell is released as soon
+        as it has been consumed, so memory stays bounded on large diagrams. Only the
+        first <mxGraphModel> of a document is read.
+
+        :param xml_data: The uncompressed XML document of a diagram page.
+        :return: A generator of (cell, geometry) pairs; geometry is None if the cell has none.
+        :raises ET.ParseError: If XML parsing fails.
         """
-        try:
-            # Try to clean up any potential XML issues before parsing
-            xml_data = xml_data.replace('&nbsp;', '&#160;')  # Common in draw.io files
-            
-            # Handle XML declaration if missing
-            if not xml_data.strip().startswith('<?xml') and '<mxGraphModel' in xml_data:
-                xml_data = '<?xml version="1.0" encoding="UTF-8"?>\n' + xml_data
-            
-            # If we only have the mxGraphModel part, wrap it
-            if xml_data.strip().startswith('<mxGraphModel') and not xml_data.strip().startswith('<diagram'):
-                xml_data = f'<diagram>{xml_data}</diagram>'
-            
-            root = ET.fromstring(xml_data)
-            
-            # If root is diagram, get the mxGraphModel inside it
-            if root.tag == 'diagram':
-                for child in root:
-                    if child.tag == 'mxGraphModel':
-                        root = child
-                        break
-            # If root is mxfile, find the first diagram and its mxGraphModel
-            elif root.tag == 'mxfile':
-                diagram = root.find('diagram')
-                if diagram is not None:
-                    # Check if mxGraphModel is a child or encoded in text
-                    mx_model = diagram.find('mxGraphModel')
-                    if mx_model is not None:
-                        root = mx_model
-            
-            self.logger.info("XML parsing completed successfully.")
-            return root
-        except ET.ParseError as e:
-            self.logger.error("Error parsing XML: " + str(e))
-            if self.strict_mode:
-                raise DiagramParsingError(str(e))
-            return None
+        # &nbsp; is common in draw.io files but is not a predefined XML entity
+        xml_bytes = xml_data.replace(b'&nbsp;', b'&#160;')
+        # A cell's geometry ends before the cell itself, and cells do not nest
+        geometry = None
+
+        if not _HAS_LXML:
+            # The stdlib iterparse has neither a tag filter nor getparent(),
+            # so keep track of the currently open elements instead.
+            path = []
+            for event, elem in ET.iterparse(BytesIO(xml_bytes), events=("start", "end")):
+                if event == "start":
+                    path.append(elem)
+                    continue
+                path.pop()
+                tag = elem.tag
+                if tag == "mxGeometry":
+                    if geometry is None and path and path[-1].tag == "mxCell":
+                        geometry = elem
+                    continue
+                if tag == "mxGraphModel":
+                    break
+                if tag == "mxCell":
+                    if path and (
+                        path[-1].tag == "mxGraphModel"
+                        or (path[-1].tag == "root" and len(path) > 1 and path[-2].tag == "mxGraphModel")
+                    ):
+                        yield elem, geometry
+                        elem.clear()
+                        # Every earlier sibling has been handled as well
+                        del path[-1][:]
+                    geometry = None
+            return
 
-    def _build_diagram_from_root(self, root):
+        # In relaxed mode libxml2 recovers from malformed XML and the cells read so far are kept.
+        # iterparse cannot take a parser object, so it gets the same options instead.
+        context = ET.iterparse(
+            BytesIO(xml_bytes), events=("end",), tag=("mxCell", "mxGeometry", "mxGraphModel"),
+            **self._parser_options()
+        )
+        for _, elem in context:
+            tag = elem.tag
+            if tag == "mxGeometry":
+                if geometry is None and elem.getparent().tag == "mxCell":
+                    geometry = elem
+                continue
+            if tag == "mxGraphModel":
+                break
+            parent = elem.getparent()
+            grandparent = parent.getparent() if parent is not None else None
+            if parent is not None and (
+                parent.tag == "mxGraphModel"
+                or (parent.tag == "root" and grandparent is not None and grandparent.tag == "mxGraphModel")
+            ):
+                yield elem, geometry
+            geometry = None
+            elem.clear()
+            while elem.getprevious() is not None:
+                del parent[0]
+        if len(context.error_log):
+            self.logger.warning(f"Recovered from malformed XML: {context.error_log.last_error}")
+
+    def _build_diagram(self, xml_data):
         """
-        Processes the XML tree starting from the <mxGraphModel> root to build the internal
-        representation of nodes, edges, and groups.
+        Processes the cells of a diagram page to build the internal representation
+        of nodes, edges, and groups.
 
-        :param root: ElementTree root element of a diagram page.
-        :return: A dictionary representing the diagram.
+        :param xml_data: The uncompressed XML document of a diagram page.
+        :return: A dictionary representing the diagram, or None if the XML could not be parsed.
+        :raises DiagramParsingError: In strict mode, if XML parsing fails.
         """
         self.node_map = {}
         self.diagram = {"nodes": [], "edges": [], "groups": {}}
-
-        # If we're starting from a diagram tag, find the mxGraphModel
-        if root.tag == 'diagram':
-            model = root.find('mxGraphModel')
-            if model is not None:
-                root = model
-        
-        diagram_root = root.find("root")
-        if diagram_root is None:
-            # Some versions might have cells directly under mxGraphModel
-            diagram_root = root
-            
-        if diagram_root is None:
-            msg = "No <root> element found in the XML."
-            self.logger.error(msg)
+        self._non_vertex_ids = set()
+
+        # Children read before their parent, keyed by the parent id
+        pending_by_parent = {}
+        debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
+        # Bind everything the per-cell loop touches to locals
+        nodes_append = self.diagram["nodes"].append
+        edges_append = self.diagram["edges"].append
+        groups = self.diagram["groups"]
+        node_map = self.node_map
+        non_vertex_ids_add = self._non_vertex_ids.add
+        assign_to_group = self._assign_to_group
+        # Style strings repeat across many cells; interning keeps one copy of each. Ids and
+        # the parent, source and target references to them are interned as well, so every
+        # reference shares the id's string and node_map lookups match by identity.
+        intern = sys.intern
+        try:
+            for cell, geometry in self._iter_cells(xml_data):
+                get = cell.get
+                cell_id = get("id")
+                if cell_id in ("0", "1"):
+                    # The root and default layer; vertices on the layer have no group
+                    non_vertex_ids_add(cell_id)
+                    continue
+                if cell_id is None:
+                    # Without an id the cell cannot be referenced or emitted
+                    if debug_enabled:
+                        self.logger.debug("Skipping cell without an id.")
+                    continue
+                cell_id = intern(cell_id)
+
+                if get("vertex") == "1":
+                    style = intern(get("style") or "")
+                    parent = get("parent")
+                    # Positional arguments: keyword calls cost twice as much per cell
+                    node = Node(
+                        cell_id,
+                        get("value") or "",
+                        style,
+                        _style_mapping(style),
+                        dict(geometry.attrib) if geometry is not None else {},
+                        intern(parent) if parent else parent
+                    )
+                    nodes_append(node)
+                    node_map[cell_id] = node
+                    # Parents are normally written before their children, so the group
+                    # can be resolved right away; otherwise wait until the parent is read.
+                    if not assign_to_group(node):
+                        waiting = pending_by_parent.get(node.parent)
+                        if waiting is None:
+                            # Hold the group's place so subgraphs keep the order of their first child
+                            pending_by_parent[node.parent] = [node]
+                            groups[node.parent] = None
+                        else:
+                            waiting.append(node)
+                    if pending_by_parent:
+                        waiting = pending_by_parent.pop(cell_id, None)
+                        if waiting is not None:
+                            if not node.is_group:
+                                del groups[cell_id]
+                            for child in waiting:
+                                assign_to_group(child)
+
+                elif get("edge") == "1":
+                    non_vertex_ids_add(cell_id)
+                    style = intern(get("style") or "")
+                    source = get("source")
+                    target = get("target")
+                    edges_append(Edge(
+                        cell_id,
+                        intern(source) if source else source,
+                        intern(target) if target else target,
+                        get("value") or "",
+                        style,
+                        _style_mapping(style)
+                    ))
+                else:
+                    # Other layers and unknown cells can be parents but never groups
+                    non_vertex_ids_add(cell_id)
+                    if debug_enabled:
+                        self.logger.debug("Skipping cell id %s: not a vertex or edge.", cell_id)
+        except ET.ParseError as e:
+            self.logger.error("Error parsing XML: " + str(e))
             if self.strict_mode:
-                raise DiagramParsingError(msg)
-            return self.diagram
-
-        for cell in diagram_root.findall("mxCell"):
-            cell_id = cell.get("id")
-            if cell_id in ("0", "1"):
-                continue
-
-            if cell.get("vertex") == "1":
-                label = cell.get("value") or ""
-                style = cell.get("style") or ""
-                geometry = cell.find("mxGeometry")
-                node = {
-                    "id": cell_id,
-                    "label": label,
-                    "style": style,
-                    "style_dict": parse_style(style),
-                    "geometry": geometry.attrib if geometry is not None else {},
-                    "parent": cell.get("parent")
-                }
-                self.diagram["nodes"].append(node)
-                self.node_map[cell_id] = node
-
-            elif cell.get("edge") == "1":
-                edge = {
-                    "id": cell_id,
-                    "source": cell.get("source"),
-                    "target": cell.get("target"),
-                    "label": cell.get("value") or "",
-                    "style": cell.get("style") or "",
-                    "style_dict": parse_style(cell.get("style") or "")
-                }
-                self.diagram["edges"].append(edge)
-            else:
-                self.logger.debug(f"Skipping cell id {cell_id}: not a vertex or edge.")
+                raise DiagramParsingError(str(e))
+            return None
+        finally:
+            # Parents that were never read as vertices do not become groups
+            for parent in pending_by_parent:
+                del groups[parent]
 
+        self.logger.info("XML parsing completed successfully.")
         self.logger.info("Built diagram: %d nodes, %d edges.",
                          len(self.diagram["nodes"]), len(self.diagram["edges"]))
-
-        for node in self.diagram["nodes"]:
-            parent = node.get("parent")
-            if parent and parent in self.node_map:
-                parent_style = self.node_map[parent].get("style", "")
-                if "group" in parent_style or "swimlane" in parent_style:
-                    if parent not in self.diagram["groups"]:
-                        self.diagram["groups"][parent] = {
-                            "label": self.node_map[parent].get("label") or f"Group_{parent}",
-                            "children": []
-                        }
-                    self.diagram["groups"][parent]["children"].append(node)
         return self.diagram
 
+    def _assign_to_group(self, node):
+        """
+        Adds a node to the group of its parent if the parent is a group or swimlane container.
+
+        :param node: Node to assign.
+        :return: False if the node has a parent that has not been read yet, True otherwise.
+        """
+        parent = node.parent
+        # A cell that names itself as parent would make its group contain itself
+        if not parent or parent == node.id:
+            return True
+        parent_node = self.node_map.get(parent)
+        if parent_node is None:
+            # Layers and other non-vertex cells are known parents that never form groups
+            return parent in self._non_vertex_ids
+        if parent_node.is_group:
+            # The entry may be a placeholder reserved while the parent was not yet read
+            if self.diagram["groups"].get(parent) is None:
+                self.diagram["groups"][parent] = {
+                    "label": parent_node.label or f"Group_{parent}",
+                    "children": []
+                }
+            self.diagram["groups"][parent]["children"].append(node)
+        return True
+
     # --- Node and Edge Formatting ---
     def _format_node(self, node):
         """
         Converts a single node from the internal representation to its Mermaid node definition.
         It uses the parsed style dictionary to choose the correct shape.
 
-        :param node: Dictionary representing a node.
+        :param node: Node to format.
         :return: Mermaid node definition string.
         """
-        label = node["label"].strip() if node["label"] else f"Node_{node['id']}"
-        style = node["style_dict"]
-        node_id = "N" + node["id"]
-
-        shape = style.get("shape", "").lower()
-        if shape == "rhombus":
-            node_def = f'{node_id}{{"{label}"}}'
-        elif shape == "ellipse" or "ellipse" in style:
-            node_def = f'{node_id}(( "{label}" ))'
-        elif style.get("rounded") == "1" or shape == "stadium":
-            node_def = f'{node_id}("{label}")'
+        label = node.label.strip() if node.label else f"Node_{node.id}"
+        if len(node.style) > _STYLE_CACHE_MAX_LEN:
+            template = _node_template(node.style_dict)
         else:
-            node_def = f'{node_id}["{label}"]'
-        return node_def
+            template = _node_template_cached(node.style)
+        return template.format(node.mermaid_id, label)
 
     def _format_edge(self, edge):
         """
         Converts a single edge into Mermaid connection notation.
+        Both endpoints must be present in the node map.
 
-        :param edge: Dictionary representing an edge.
+        :param edge: Edge to format.
         :return: Mermaid edge definition string.
         """
-        src = "N" + edge["source"]
-        tgt = "N" + edge["target"]
-        label = edge["label"].strip()
-        style = edge["style_dict"]
-
-        arrow = "-->"
-        if style.get("dashed") or style.get("dashed") == "1":
-            arrow = "-.->"
-        if style.get("endArrow") == "none":
-            arrow = arrow.replace("->", "-")
+        src = self.node_map[edge.source].mermaid_id
+        tgt = self.node_map[edge.target].mermaid_id
+        label = edge.label.strip()
+        if len(edge.style) > _STYLE_CACHE_MAX_LEN:
+            arrow = _edge_arrow(edge.style_dict)
+        else:
+            arrow = _edge_arrow_cached(edge.style)
 
         if label:
             edge_def = f'{src} -- "{label}" {arrow} {tgt}'
@@ -497,82 +824,99 @@ class FlowForgeConverter:
         """
         Recursively emits a subgraph for a group and any nested groups.
 
+        Nested groups are emitted inside their parent and again at the top level, so each
+        subgraph is rendered once per emit and re-indented on later uses. A group that is
+        nested inside itself through a cycle of parents is not entered again.
+
         :param group_id: The group identifier.
         :param group: Dictionary with keys "label" and "children".
         :param indent_level: Current indentation level (for formatting).
         :return: A list of Mermaid syntax lines for this subgraph.
         """
+        lines = self._subgraph_cache.get(group_id)
+        if lines is None:
+            groups = self.diagram["groups"]
+            open_groups = self._subgraphs_open
+            cycles_seen = self._subgraph_cycles
+            open_groups.add(group_id)
+            lines = [f"subgraph {group_id}[{group['label']}]"]
+            for child in group.get("children", []):
+                child_id = child.id
+                nested_group = groups.get(child_id)
+                if nested_group is None:
+                    lines.append("    " + self._format_node(child))
+                elif child_id in open_groups:
+                    self.logger.warning("Skipping group %s nested in itself under group %s.", child_id, group_id)
+                    self._subgraph_cycles += 1
+                else:
+                    lines.extend(self._emit_subgraph_recursive(child_id, nested_group, 1))
+            lines.append("end")
+            open_groups.discard(group_id)
+            # Lines cut short by a cycle depend on where the group was entered from
+            if self._subgraph_cycles == cycles_seen:
+                self._subgraph_cache[group_id] = lines
+        if not indent_level:
+            return lines
         indent = "    " * indent_level
-        lines = []
-        lines.append(f"{indent}subgraph {group_id}[{group['label']}]")
-        for child in group.get("children", []):
-            child_id = child["id"]
-            if child_id in self.diagram["groups"]:
-                nested_group = self.diagram["groups"][child_id]
-                lines.extend(self._emit_subgraph_recursive(child_id, nested_group, indent_level + 1))
-            else:
-                try:
-                    node_def = self._format_node(child)
-                    lines.append(f"{indent}    {node_def}")
-                except Exception as e:
-                    self.logger.warning(f"Error formatting node {child_id} in group {group_id}: {str(e)}")
-        lines.append(f"{indent}end")
-        return lines
+        return [indent + line for line in lines]
 
-    def _emit_mermaid(self, diagram, direction="TD", diagram_type="flowchart"):
+    def _mermaid_lines(self, diagram, direction, diagram_type):
         """
-        Converts the internal diagram representation into Mermaid code.
+        Builds the lines of Mermaid code for the internal diagram representation.
 
-        Currently supports 'flowchart' diagram_type.
         :param diagram: Dictionary containing nodes, edges, and groups.
-        :param direction: Mermaid flow direction (e.g., TD for top-down, LR for left-right).
+        :param direction: Mermaid flow direction.
         :param diagram_type: Type of Mermaid diagram to emit.
-        :return: Mermaid code as a string.
+        :return: A list of Mermaid syntax lines.
         """
-        lines = []
-        if diagram_type == "flowchart":
-            lines.append(f"flowchart {direction}")
-        else:
+        if diagram_type != "flowchart":
             self.logger.warning(f"Diagram type '{diagram_type}' not fully supported. Defaulting to flowchart.")
-            lines.append(f"flowchart {direction}")
+        lines = [f"flowchart {direction}"]
 
         nodes_emitted = set()
+        self._subgraph_cache = {}
+        self._subgraphs_open = set()
+        self._subgraph_cycles = 0
+        # Bind the per-item callables once; the comprehensions below run once per node and edge
+        format_node = self._format_node
+        format_edge = self._format_edge
+        node_map = self.node_map
 
         for group_id, group in diagram.get("groups", {}).items():
-            try:
-                group_lines = self._emit_subgraph_recursive(group_id, group, indent_level=0)
-                lines.extend(group_lines)
-                for child in group.get("children", []):
-                    nodes_emitted.add(child["id"])
-            except Exception as e:
-                self.logger.warning(f"Error emitting subgraph for group {group_id}: {str(e)}")
-
-        for node in diagram.get("nodes", []):
-            if node["id"] not in nodes_emitted:
-                try:
-                    node_def = self._format_node(node)
-                    lines.append(node_def)
-                except Exception as e:
-                    self.logger.warning(f"Error formatting node {node['id']}: {str(e)}")
+            lines.extend(self._emit_subgraph_recursive(group_id, group, indent_level=0))
+            nodes_emitted.update([child.id for child in group.get("children", [])])
+
+        lines.extend([format_node(node) for node in diagram.get("nodes", []) if node.id not in nodes_emitted])
+
+        edges = diagram.get("edges", [])
+        valid_edges = [edge for edge in edges if edge.source in node_map and edge.target in node_map]
+        if len(valid_edges) != len(edges):
+            for edge in edges:
+                if edge.source not in node_map or edge.target not in node_map:
+                    self.logger.warning("Skipping edge %s due to missing endpoints.", edge.id)
+        lines.extend([format_edge(edge) for edge in valid_edges])
+        return lines
 
-        for edge in diagram.get("edges", []):
-            try:
-                if edge["source"] not in self.node_map or edge["target"] not in self.node_map:
-                    self.logger.warning(f"Skipping edge {edge['id']} due to missing endpoints.")
-                    continue
-                edge_def = self._format_edge(edge)
-                lines.append(edge_def)
-            except Exception as e:
-                self.logger.warning(f"Error formatting edge {edge['id']}: {str(e)}")
+    def _emit_mermaid(self, diagram, direction="TD", diagram_type="flowchart"):
+        """
+        Converts the internal diagram representation into Mermaid code.
 
-        return "\n".join(lines)
+        Currently supports 'flowchart' diagram_type.
+        :param diagram: Dictionary containing nodes, edges, and groups.
+        :param direction: Mermaid flow direction (e.g., TD for top-down, LR for left-right).
+        :param diagram_type: Type of Mermaid diagram to emit.
+        :return: Mermaid code as a string.
+        """
+        # A single join sizes the result once; io.StringIO buffers its writes in a
+        # list of strings as well, so it saves no memory and adds a call per line.
+        return "\n".join(self._mermaid_lines(diagram, direction, diagram_type))
 
     # --- Main Conversion Method ---
     def convert(self, input_data, diagram_index=0, direction="TD", diagram_type="flowchart"):
         """
         Main method to convert Draw.io XML data to Mermaid code.
 
-        :param input_data: Raw content of the Draw.io file.
+        :param input_data: Raw content of the Draw.io file, as str or a bytes-like object.
         :param diagram_index: Which diagram page to convert (default: 0).
         :param direction: Flow direction for Mermaid (e.g., "TD", "LR").
         :param diagram_type: The type of Mermaid diagram to emit (default: "flowchart").
@@ -581,7 +925,6 @@ class FlowForgeConverter:
         """
         try:
             self.logger.info("Starting conversion process.")
-            self.diagram_pages = []
             self._decompress_data(input_data)
             if not self.diagram_pages:
                 msg = "No valid diagram pages found."
@@ -600,10 +943,9 @@ class FlowForgeConverter:
                     diagram_index = 0
 
             xml_diagram = self.diagram_pages[diagram_index]
-            root = self._parse_xml(xml_diagram)
-            if root is None:
+            diagram = self._build_diagram(xml_diagram)
+            if diagram is None:
                 return ""
-            diagram = self._build_diagram_from_root(root)
             mermaid_code = self._emit_mermaid(diagram, direction=direction, diagram_type=diagram_type)
             self.logger.info("Conversion completed successfully.")
             return mermaid_code
@@ -617,7 +959,6 @@ class FlowForgeConverter:
 
 # --- Example Usage ---
 if __name__ == "__main__":
-    import sys
 
     converter = FlowForgeConverter(log_level=logging.DEBUG, strict_mode=False)
     try:
@@ -19,5 +19,9 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     python_requires='>=3.6',
+    extras_require={
+        "lxml": ["lxml"],
+        "isal": ["isal"],
+    },
 )
 
@@ -0,0 +1,125 @@
+import base64
+import logging
+import unittest
+import zlib
+
+from flowforge import FlowForgeConverter
+from flowforge.flowforge import _HAS_LXML, DiagramParsingError
+
+
+def model(cells):
+    body = '<mxCell id="0"/><mxCell id="1" parent="0"/>' + "".join(cells)
+    return f'<mxGraphModel><root>{body}</root></mxGraphModel>'
+
+
+def v(i, label, style="", parent="1"):
+    return f'<mxCell id="{i}" value="{label}" style="{style}" vertex="1" parent="{parent}"/>'
+
+
+def mxfile(*models):
+    """Wraps page models in an mxfile the way draw.io saves them: raw deflate + base64."""
+    diagrams = []
+    for i, page in enumerate(models):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        payload = compressor.compress(page.encode("utf-8")) + compressor.flush()
+        diagrams.append(f'<diagram id="d{i}">{base64.b64encode(payload).decode("ascii")}</diagram>')
+    return "<mxfile>" + "".join(diagrams) + "</mxfile>"
+
+
+class GroupCycleTest(unittest.TestCase):
+
+    def convert(self, xml, strict_mode):
+        converter = FlowForgeConverter(log_level=logging.CRITICAL, strict_mode=strict_mode)
+        return converter.convert(xml)
+
+    def test_group_that_is_its_own_parent(self):
+        xml = model(v(2, "A", "group;", parent="2") + v(3, "B"))
+        for strict_mode in (True, False):
+            self.assertEqual(self.convert(xml, strict_mode), 'flowchart TD\nN2["A"]\nN3["B"]')
+
+    def test_groups_that_are_each_others_parent(self):
+        xml = model(v(2, "A", "group;", parent="3") + v(3, "B", "group;", parent="2") + v(4, "C"))
+        for strict_mode in (True, False):
+            mermaid = self.convert(xml, strict_mode)
+            self.assertIn("subgraph 2[A]", mermaid)
+            self.assertIn("subgraph 3[B]", mermaid)
+            self.assertIn('N4["C"]', mermaid)
+
+
+class GroupDetectionTest(unittest.TestCase):
+
+    def test_aws4_group_shapes_are_containers(self):
+        for style in ("shape=mxgraph.aws4.group;grIcon=mxgraph.aws4.group_aws_cloud;",
+                      "shape=mxgraph.aws4.groupCenter;"):
+            xml = model(v("g", "AWS", style) + v("a", "A", parent="g"))
+            converter = FlowForgeConverter(log_level=logging.CRITICAL, strict_mode=True)
+            self.assertEqual(converter.convert(xml), 'flowchart TD\nsubgraph g[AWS]\n    Na["A"]\nend\nNg["AWS"]')
+
+
+class GroupOrderTest(unittest.TestCase):
+
+    def test_children_read_before_their_groups(self):
+        xml = model(
+            v("c1", "C1", parent="G") + v("d1", "D1", parent="H")
+            + v("H", "H", "group") + v("G", "G", "swimlane")
+        )
+        converter = FlowForgeConverter(log_level=logging.CRITICAL, strict_mode=True)
+        mermaid = converter.convert(xml)
+        # Subgraphs follow the document order of their first child, not of the group cell
+        self.assertLess(mermaid.index("subgraph G[G]"), mermaid.index("subgraph H[H]"))
+
+    def test_no_group_placeholders_left_after_a_parse_error(self):
+        xml = model(v("c1", "C1", parent="G") + v(2, "A")).replace('<mxCell id="2"', '<mxCell id="2" <broken')
+        converter = FlowForgeConverter(log_level=logging.CRITICAL, strict_mode=True)
+        with self.assertRaises(DiagramParsingError):
+            converter.convert(xml)
+        self.assertEqual(converter.diagram["groups"], {})
+
+
+class StrictModeTest(unittest.TestCase):
+
+    def test_strict_mode_can_be_changed_after_construction(self):
+        # Truncated after the first vertex
+        xml = model(v(2, "A") + v(3, "B"))[:-len("</root></mxGraphModel>")]
+        converter = FlowForgeConverter(log_level=logging.CRITICAL, strict_mode=False)
+        converter.convert(xml)
+        converter.strict_mode = True
+        with self.assertRaises(DiagramParsingError):
+            converter.convert(xml)
+
+
+class MalformedXmlTest(unittest.TestCase):
+
+    def test_relaxed_mode_keeps_cells_read_before_the_error(self):
+        xml = model(v(2, "A") + v(3, "B")).replace('<mxCell id="3"', '<mxCell id="3" <broken')
+        converter = FlowForgeConverter(log_level=logging.CRITICAL, strict_mode=False)
+        # lxml recovers from the error; the stdlib parser gives up on the whole page
+        expected = 'flowchart TD\nN2["A"]' if _HAS_LXML else ""
+        self.assertEqual(converter.convert(xml), expected)
+
+    def test_strict_mode_raises(self):
+        xml = model(v(2, "A") + v(3, "B")).replace('<mxCell id="3"', '<mxCell id="3" <broken')
+        converter = FlowForgeConverter(log_level=logging.CRITICAL, strict_mode=True)
+        with self.assertRaises(DiagramParsingError):
+            converter.convert(xml)
+
+
+class InputTypeTest(unittest.TestCase):
+
+    def test_entity_escaped_diagram_payload(self):
+        page = model(v(2, "A"))
+        escaped = page.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+        xml = f'<mxfile><diagram id="d0">{escaped}</diagram></mxfile>'
+        converter = FlowForgeConverter(log_level=logging.CRITICAL, strict_mode=True)
+        self.assertEqual(converter.convert(xml), 'flowchart TD\nN2["A"]')
+
+    def test_bytes_like_input(self):
+        data = mxfile(model(v(2, "A")), model(v(3, "B"))).encode("utf-8")
+        for input_data in (data, bytearray(data), memoryview(data)):
+            converter = FlowForgeConverter(log_level=logging.CRITICAL, strict_mode=True)
+            self.assertEqual(converter.list_diagram_pages(input_data), [0, 1])
+            self.assertEqual(converter.convert(input_data, diagram_index=1), 'flowchart TD\nN3["B"]')
+
+
+if __name__ == "__main__":
+    unittest.main()